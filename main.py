@@ -1,15 +1,21 @@
 import os
 import json
+import random
 import asyncio
 import logging
-import hashlib
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 
 import aiohttp
-from flask import Flask, request
-from threading import Thread
-from telegram import Bot
+from aiohttp import web
+from watchfiles import awatch
+
+try:
+    import orjson  # faster UTF-8 JSON; stdlib json is used as a fallback
+except ImportError:
+    orjson = None
 
 # -----------------------
 # Configuration
@@ -21,11 +27,29 @@ EVENTS_FILE = Path("events.json")
 SENT_FILE = Path("sent_records.json")
 WINDOW_MINUTES = int(os.environ.get("WINDOW_MINUTES", "5"))  # window for sending (minutes)
 SELF_PING_INTERVAL = int(os.environ.get("SELF_PING_INTERVAL", "300"))  # seconds (5 min)
+SEND_ATTEMPTS = 3  # tries per Telegram message before giving up
+SEND_MAX_RETRY_AFTER = 30  # seconds; longer flood-control waits are left to the scheduler
+
+# Derived constants, built once instead of per event/check
+WINDOW_TD = timedelta(minutes=WINDOW_MINUTES)
+WINDOW_S = WINDOW_MINUTES * 60
+RETRY_TD = timedelta(seconds=10)  # re-check delay for an announcement still due
+PRE_ANNOUNCE_TD = timedelta(hours=1)  # pre-announcement lead time
+PRE_ANNOUNCE_S = int(PRE_ANNOUNCE_TD.total_seconds())
+ONE_DAY_TD = timedelta(days=1)
+SENT_KEEP_TD = timedelta(days=2)  # how long sent records are kept
+
+# "days" abbreviations used in events.json, indexed by datetime.weekday();
+# avoids the locale-dependent strftime("%a")
+DAY_ABBR = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Shared HTTP session for all outbound calls; created in main_async() once the loop runs
+SESSION: aiohttp.ClientSession | None = None
 
 if not BOT_TOKEN:
     raise SystemExit("Please set BOT_TOKEN environment variable")
 
-bot = Bot(token=BOT_TOKEN)
+TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
 # -----------------------
 # Logging
@@ -38,27 +62,25 @@ logging.basicConfig(
 log = logging.getLogger("bcl_bot")
 
 # -----------------------
-# Flask keep-alive (runs in separate thread)
+# Keep-alive web server (runs on the main event loop)
 # -----------------------
-app = Flask(__name__)
+async def home(request):
+    return web.Response(text="✅ Bot is alive and running!")
 
-@app.route("/", methods=["GET", "HEAD"])
-def home():
-    return "✅ Bot is alive and running!", 200
+async def health(request):
+    return web.json_response({"status": "ok", "time": datetime.utcnow().isoformat()})
 
-@app.route("/health", methods=["GET"])
-def health():
-    return {"status": "ok", "time": datetime.utcnow().isoformat()}, 200
+webapp = web.Application()
+webapp.router.add_get("/", home)  # add_get also answers HEAD
+webapp.router.add_get("/health", health)
 
-def run_flask():
+async def start_web_server():
     port = int(os.environ.get("PORT", "8080"))
-    # disable reloader, debug etc.
-    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
-
-def start_flask_thread():
-    t = Thread(target=run_flask, daemon=True)
-    t.start()
-    log.info("Flask keep-alive started")
+    runner = web.AppRunner(webapp)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    log.info("Keep-alive server started on port %s", port)
+    return runner
 
 # -----------------------
 # JSON utilities
@@ -67,6 +89,8 @@ def load_json(path: Path, default=None):
     try:
         if not path.exists():
             return default if default is not None else []
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         return json.loads(path.read_text(encoding="utf-8"))
     except Exception as e:
         log.error("Failed to load JSON %s: %s", path, e)
@@ -74,38 +98,119 @@ def load_json(path: Path, default=None):
 
 def save_json(path: Path, data):
     try:
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        if orjson is not None:
+            path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
     except Exception as e:
         log.error("Failed to save JSON %s: %s", path, e)
 
-def file_hash(path: Path):
-    if not path.exists():
+def file_sig(path: Path):
+    """Cheap change signature for *path* (mtime + size), or None if missing."""
+    try:
+        s = path.stat()
+    except FileNotFoundError:
         return None
-    data = path.read_bytes()
-    return hashlib.sha256(data).hexdigest()
+    return (s.st_mtime_ns, s.st_size)
+
+# Async wrappers: run the blocking disk I/O off the event loop thread
+async def aload_json(path: Path, default=None):
+    return await asyncio.to_thread(load_json, path, default)
+
+async def asave_json(path: Path, data):
+    await asyncio.to_thread(save_json, path, data)
+
+# sent_records.json is only written by this process, so keep it in memory and
+# persist on change instead of re-reading it on every check.
+# Each sent announcement is recorded as a "YYYY-MM-DD|name|kind" key.
+def load_sent_keys(path: Path):
+    data = load_json(path, [])
+    try:
+        if isinstance(data, dict):
+            # older {date: {name: [kinds]}} layout
+            keys = {f"{day}|{name}|{kind}" for day, names in data.items()
+                    for name, kinds in names.items() for kind in kinds}
+        else:
+            keys = set(data)
+        if not all(isinstance(k, str) for k in keys):
+            raise ValueError("keys must be strings")
+        return keys
+    except Exception as e:
+        log.error("Ignoring malformed sent records in %s: %s", path, e)
+        return set()
+
+SENT: set[str] = load_sent_keys(SENT_FILE)
 
 # -----------------------
 # Messaging helpers
 # -----------------------
-async def send_message(text: str, thread_id: int | None = None):
-    try:
-        await bot.send_message(chat_id=CHAT_ID, text=text, message_thread_id=thread_id)
-        log.info("Sent message to chat %s (thread=%s): %s", CHAT_ID, thread_id, text.replace("\n"," | ")[:200])
-    except Exception as e:
-        log.exception("Failed to send message: %s", e)
+class TelegramAPIError(Exception):
+    """Bot API call answered with ok=false.
+
+    Raised instead of aiohttp.ClientResponseError so the token-bearing URL never
+    ends up in logs.
+    """
+
+    def __init__(self, status: int, description: str, retry_after: float | None = None):
+        super().__init__(f"{status}: {description}")
+        self.status = status
+        self.retry_after = retry_after
+
+async def telegram_post(method: str, payload: dict):
+    """POST *payload* to Bot API *method* over the shared session and return its result."""
+    async with SESSION.post(f"{TELEGRAM_API}/{method}", json=payload) as resp:
+        try:
+            data = await resp.json(content_type=None)
+        except ValueError:
+            raise TelegramAPIError(resp.status, "invalid JSON response") from None
+    if not isinstance(data, dict):
+        # e.g. an empty body from a proxy/gateway 502/504
+        raise TelegramAPIError(resp.status, "unexpected response")
+    if not data.get("ok"):
+        params = data.get("parameters") or {}
+        raise TelegramAPIError(resp.status, data.get("description", ""), params.get("retry_after"))
+    return data.get("result")
 
-def format_pre_announcement(ev):
+async def send_message(text: str, thread_id: int | None = None):
+    """Send *text* to the chat; errors propagate so the caller can tell it wasn't sent."""
+    payload = {"chat_id": CHAT_ID, "text": text}
+    if thread_id is not None:
+        payload["message_thread_id"] = thread_id
+    for attempt in range(SEND_ATTEMPTS):
+        last = attempt == SEND_ATTEMPTS - 1
+        try:
+            await telegram_post("sendMessage", payload)
+            break
+        except TelegramAPIError as e:
+            # only flood control (429) and server errors are worth retrying; a long
+            # flood-control wait would hold up every other due announcement, so
+            # give up and let next_wakeup() re-check while the window is open
+            if last or (e.retry_after is None and e.status < 500):
+                raise
+            if e.retry_after is not None and e.retry_after > SEND_MAX_RETRY_AFTER:
+                raise
+            delay = e.retry_after if e.retry_after is not None else 2 ** attempt
+            log.warning("Send attempt %d failed (%s); retrying in %ss", attempt + 1, e, delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if last:
+                raise
+            delay = 2 ** attempt
+            log.warning("Send attempt %d failed (%s); retrying in %ss", attempt + 1, e, delay)
+        await asyncio.sleep(delay)
+    log.info("Sent message to chat %s (thread=%s): %s", CHAT_ID, thread_id, text.replace("\n"," | ")[:200])
+
+def format_pre_announcement(name_en: str, name_kr: str, time_str: str):
     # Template:
     # 📢 Event starts soon! (in 1 hour)
     # 🕓 AGB — 12:00 UTC
     # (KR)
-    en = f"📢 Event starts soon! (in 1 hour)\n🕓 {ev['name_en']} — {ev['time']} UTC"
-    kr = f"곧 이벤트가 시작됩니다! (1시간 후)\n🕓 {ev['name_kr']} — {ev['time']} UTC"
+    en = f"📢 Event starts soon! (in 1 hour)\n🕓 {name_en} — {time_str} UTC"
+    kr = f"곧 이벤트가 시작됩니다! (1시간 후)\n🕓 {name_kr} — {time_str} UTC"
     return f"{en}\n\n{kr}"
 
-def format_start_announcement(ev):
-    en = f"🔥 Event {ev['name_en']} has started! Join now!"
-    kr = f"{ev['name_kr']} 이벤트가 시작되었습니다! 지금 참여하세요!"
+def format_start_announcement(name_en: str, name_kr: str):
+    en = f"🔥 Event {name_en} has started! Join now!"
+    kr = f"{name_kr} 이벤트가 시작되었습니다! 지금 참여하세요!"
     return f"{en}\n\n{kr}"
 
 # -----------------------
@@ -122,9 +227,62 @@ def format_start_announcement(ev):
 #   },
 #   ...
 # ]
+#
+# Raw entries are compiled once per (re)load into Event tuples, so the
+# scheduler never re-parses "HH:MM", scans the "days" list or re-formats the
+# announcement texts.
+
+Event = namedtuple(
+    "Event", "name_key name_en name_kr time_str days_set hh mm thread_id pre_text start_text"
+)
 
-def next_event_datetime_for_day(time_str: str, target_date: datetime.date):
-    hh, mm = map(int, time_str.split(":"))
+def compile_events(raw):
+    """Turn the raw events.json list into Event tuples, skipping invalid entries.
+
+    Returns ``(events, by_weekday)`` where *by_weekday* maps "Mon".."Sun" to the
+    events scheduled on that day.
+    """
+    events = []
+    for item in raw:
+        try:
+            name_en, name_kr, time_str = item["name_en"], item["name_kr"], item["time"]
+            hh, mm = map(int, time_str.split(":"))
+            time(hh, mm)  # raises ValueError for out-of-range hours/minutes
+            days = item.get("days", [])
+            if isinstance(days, str):
+                days = [days]
+            unknown = set(days) - set(DAY_ABBR)
+            if unknown:
+                raise ValueError(f"unknown days {sorted(unknown)}; use {', '.join(DAY_ABBR)}")
+            if not isinstance(name_en, str) or not isinstance(name_kr, str):
+                raise ValueError("name_en and name_kr must be strings")
+            thread_id = item.get("thread_id", DEFAULT_THREAD_ID)
+            if thread_id is not None and (not isinstance(thread_id, int) or isinstance(thread_id, bool)):
+                raise ValueError(f"thread_id must be an integer, got {thread_id!r}")
+            events.append(Event(
+                name_key=name_en,
+                name_en=name_en,
+                name_kr=name_kr,
+                time_str=time_str,
+                days_set=frozenset(days),
+                hh=hh,
+                mm=mm,
+                thread_id=thread_id,
+                pre_text=format_pre_announcement(name_en, name_kr, time_str),
+                start_text=format_start_announcement(name_en, name_kr),
+            ))
+        except Exception as e:
+            log.error("Skipping invalid event %r: %s", item, e)
+    by_weekday = {}
+    for ev in events:
+        for day in ev.days_set:
+            by_weekday.setdefault(day, []).append(ev)
+    return events, by_weekday
+
+# Cached on plain (hh, mm, date) rather than the Event, so cache keys never
+# depend on other (possibly unhashable) fields.
+@lru_cache(maxsize=512)
+def next_event_datetime_for_day(hh: int, mm: int, target_date: datetime.date):
     return datetime(
         year=target_date.year,
         month=target_date.month,
@@ -135,94 +293,145 @@ def next_event_datetime_for_day(time_str: str, target_date: datetime.date):
         microsecond=0,
     )
 
-async def check_and_send_once(events):
+@lru_cache(maxsize=256)
+def event_instants(hh: int, mm: int, target_date: datetime.date):
+    """Return ``(pre_s, start_s)``: UTC epoch seconds of the pre/start announcements
+    for an event at *hh*:*mm* on *target_date*."""
+    start_s = int(next_event_datetime_for_day(hh, mm, target_date).replace(tzinfo=timezone.utc).timestamp())
+    return start_s - PRE_ANNOUNCE_S, start_s
+
+def next_wakeup(by_weekday, now: datetime):
+    """Return when the scheduler should next check for due announcements.
+
+    That is the next of today's instants after *now*, or shortly after *now* if
+    an announcement whose window is still open hasn't been sent yet (it came
+    due during a slow send, or its send failed). If nothing is left today,
+    wake at the start of the next day so tomorrow's schedule gets picked up.
+    """
+    weekday = DAY_ABBR[now.weekday()]
+    today_str = f"{now.year:04d}-{now.month:02d}-{now.day:02d}"
+    candidates = []
+    for ev in by_weekday.get(weekday, ()):
+        event_dt = next_event_datetime_for_day(ev.hh, ev.mm, now.date())
+        for kind, dt in (("pre", event_dt - PRE_ANNOUNCE_TD), ("start", event_dt)):
+            if dt > now:
+                candidates.append(dt)
+            elif dt + WINDOW_TD > now and f"{today_str}|{ev.name_key}|{kind}" not in SENT:
+                candidates.append(now + RETRY_TD)
+    tomorrow = datetime.combine(now.date() + ONE_DAY_TD, datetime.min.time())
+    return min(candidates, default=tomorrow)
+
+async def check_and_send_once(by_weekday):
     """Check events for *today* and send due messages within WINDOW_MINUTES window."""
     now = datetime.utcnow()
-    weekday = now.strftime("%a")  # Mon, Tue, ...
-    today_str = now.strftime("%Y-%m-%d")
-    sent = load_json(SENT_FILE, {})
-    if today_str not in sent:
-        sent[today_str] = {}
-
-    changed = False
-
-    for ev in events:
-        if weekday not in ev.get("days", []):
-            continue
-
-        name_key = ev.get("name_en", ev.get("name", "event"))
-        thread_id = ev.get("thread_id", DEFAULT_THREAD_ID)
-        event_dt = next_event_datetime_for_day(ev["time"], now.date())
-        pre_dt = event_dt - timedelta(hours=1)
-
-        sent_today = sent[today_str].get(name_key, [])
+    weekday = DAY_ABBR[now.weekday()]
+    today_str = f"{now.year:04d}-{now.month:02d}-{now.day:02d}"
+    # keep only the last 2 days of records so the state doesn't grow forever
+    cutoff = (now.date() - SENT_KEEP_TD).isoformat()
+    stale = {k for k in SENT if k[:10] < cutoff}
+    SENT.difference_update(stale)
+    changed = bool(stale)
+
+    # compare plain ints instead of building datetimes/timedeltas per event
+    now_s = int(now.replace(tzinfo=timezone.utc).timestamp())
+    today = now.date()
+
+    # (sent key, send coroutine) for every announcement due now; sent concurrently
+    pending = []
+    for ev in by_weekday.get(weekday, ()):
+        pre_s, start_s = event_instants(ev.hh, ev.mm, today)
 
         # Pre-announcement (1 hour before)
-        if pre_dt <= now <= pre_dt + timedelta(minutes=WINDOW_MINUTES) and "pre" not in sent_today:
-            text = format_pre_announcement(ev)
-            await send_message(text, thread_id)
-            sent_today.append("pre")
-            changed = True
+        key = f"{today_str}|{ev.name_key}|pre"
+        if pre_s <= now_s <= pre_s + WINDOW_S and key not in SENT:
+            pending.append((key, send_message(ev.pre_text, ev.thread_id)))
 
         # Start announcement
-        if event_dt <= now <= event_dt + timedelta(minutes=WINDOW_MINUTES) and "start" not in sent_today:
-            text = format_start_announcement(ev)
-            await send_message(text, thread_id)
-            sent_today.append("start")
-            changed = True
-
-        if sent_today:
-            sent[today_str][name_key] = sent_today
+        key = f"{today_str}|{ev.name_key}|start"
+        if start_s <= now_s <= start_s + WINDOW_S and key not in SENT:
+            pending.append((key, send_message(ev.start_text, ev.thread_id)))
+
+    results = await asyncio.gather(*(coro for _, coro in pending), return_exceptions=True)
+    for (key, _), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            log.error("Failed to send announcement %s: %s", key, result, exc_info=result)
+            continue
+        SENT.add(key)
+        changed = True
 
     if changed:
-        save_json(SENT_FILE, sent)
+        await asave_json(SENT_FILE, sorted(SENT))
 
 # -----------------------
 # Auto-ping self (keeps service alive on some hosts)
 # -----------------------
-async def self_ping_loop(public_url: str):
+async def self_ping_loop(public_url: str, session: aiohttp.ClientSession):
     if not public_url:
         log.warning("No PUBLIC_URL set; self-ping disabled")
         return
-    async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                async with session.get(public_url, timeout=25) as resp:
-                    log.info("Self-ping %s -> %s", public_url, resp.status)
-            except Exception as e:
-                log.warning("Self-ping failed: %s", e)
-            await asyncio.sleep(SELF_PING_INTERVAL)
+    # HEAD on /health: no response body, and a short timeout since it's our own server
+    url = public_url.rstrip("/") + "/health"
+    timeout = aiohttp.ClientTimeout(total=5)
+    while True:
+        try:
+            async with session.head(url, timeout=timeout) as resp:
+                log.info("Self-ping %s -> %s", url, resp.status)
+        except Exception as e:
+            log.warning("Self-ping failed: %s", e)
+        # jitter so pings from several instances don't line up
+        await asyncio.sleep(max(1, SELF_PING_INTERVAL + random.uniform(-15, 15)))
 
 # -----------------------
-# File watch loop to auto-reload events.json
+# File watch + scheduler loop
 # -----------------------
-async def events_watch_loop():
-    last_hash = file_hash(EVENTS_FILE)
-    events = load_json(EVENTS_FILE, [])
+async def events_file_watcher(reload_event: asyncio.Event):
+    """Set *reload_event* whenever events.json changes on disk."""
+    target = EVENTS_FILE.resolve()
+    last_sig = file_sig(EVENTS_FILE)
+    # watch the directory (not its subdirectories) so editors that replace the
+    # file are still picked up
+    async for _ in awatch(
+        target.parent, watch_filter=lambda change, path: Path(path) == target, recursive=False
+    ):
+        current_sig = file_sig(EVENTS_FILE)
+        if current_sig != last_sig:
+            last_sig = current_sig
+            reload_event.set()
+
+async def events_watch_loop(reload_event: asyncio.Event):
+    events, by_weekday = compile_events(await aload_json(EVENTS_FILE, []))
     log.info("Loaded %d events", len(events))
-    # initial immediate check (in case events are due now)
-    await check_and_send_once(events)
     while True:
-        await asyncio.sleep(60)  # check every minute
-        current_hash = file_hash(EVENTS_FILE)
-        if current_hash != last_hash:
-            log.info("Detected change in events.json - reloading")
-            events = load_json(EVENTS_FILE, [])
-            log.info("Reloaded %d events", len(events))
-            # clear old sent_records for future days? keep existing
-            # run an immediate check so edits for near-future events are applied
-            await check_and_send_once(events)
-            last_hash = current_hash
-        else:
-            # regular scheduled check
-            await check_and_send_once(events)
+        # check first (in case events are due now), then sleep until the next
+        # announcement instant or until events.json changes
+        await check_and_send_once(by_weekday)
+        now = datetime.utcnow()
+        delay = (next_wakeup(by_weekday, now) - now).total_seconds()
+        try:
+            await asyncio.wait_for(reload_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            continue
+        reload_event.clear()
+        log.info("Detected change in events.json - reloading")
+        events, by_weekday = compile_events(await aload_json(EVENTS_FILE, []))
+        log.info("Reloaded %d events", len(events))
 
 # -----------------------
 # Main entry
 # -----------------------
 async def main_async():
-    # Start Flask keep-alive thread
-    start_flask_thread()
+    global SESSION
+
+    # Start keep-alive web server
+    runner = await start_web_server()
+
+    # One pooled session so repeated requests reuse TCP/TLS connections
+    SESSION = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=10, keepalive_timeout=75, ttl_dns_cache=300, enable_cleanup_closed=True
+        ),
+        timeout=aiohttp.ClientTimeout(total=25),
+    )
 
     # Determine public URL for self-ping (Render will set)
     PUBLIC_URL = os.environ.get("PUBLIC_URL")  # recommended to set on Render to https://<app>.onrender.com
@@ -233,16 +442,35 @@ async def main_async():
         render_account = os.environ.get("RENDER_ACCOUNT")
         # If not available, keep disabled.
     # start self-ping loop if PUBLIC_URL provided
-    if PUBLIC_URL:
-        asyncio.create_task(self_ping_loop(PUBLIC_URL))
-    else:
-        log.info("PUBLIC_URL not set; self-ping disabled. It's recommended to set PUBLIC_URL environment var to your https URL.")
-
-    # Start events watch loop (this includes periodic checks)
-    await events_watch_loop()
+    # Run all loops in one TaskGroup: a crash in any of them is surfaced here and
+    # the others are cancelled, instead of dying silently in a detached task
+    try:
+        async with asyncio.TaskGroup() as tg:
+            if PUBLIC_URL:
+                tg.create_task(self_ping_loop(PUBLIC_URL, SESSION))
+            else:
+                log.info("PUBLIC_URL not set; self-ping disabled. It's recommended to set PUBLIC_URL environment var to your https URL.")
+
+            # Start events.json watcher and the scheduler loop it wakes up
+            reload_event = asyncio.Event()
+            tg.create_task(events_file_watcher(reload_event))
+            tg.create_task(events_watch_loop(reload_event))
+    except* Exception as eg:
+        for exc in eg.exceptions:
+            log.error("Background task failed: %s", exc, exc_info=exc)
+        # exit non-zero so the host sees a crash, not a clean shutdown
+        raise SystemExit(1) from None
+    finally:
+        await SESSION.close()
+        await runner.cleanup()
 
 def main():
     log.info("Starting bot main")
+    try:
+        import uvloop  # libuv-based loop; not available on Windows
+        uvloop.install()
+    except ImportError:
+        pass
     try:
         asyncio.run(main_async())
     except KeyboardInterrupt:
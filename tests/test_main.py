@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+
+def make_schedule(*times, days=("Mon",)):
+    raw = [
+        {"name_en": f"E{i}", "name_kr": f"E{i}", "time": t, "days": list(days)}
+        for i, t in enumerate(times)
+    ]
+    return main.compile_events(raw)[1]
+
+
+def test_next_wakeup_returns_next_instant():
+    main.SENT.clear()
+    by_weekday = make_schedule("12:00")
+    # 2026-10-12 is a Monday
+    assert main.next_wakeup(by_weekday, datetime(2026, 10, 12, 10, 0)) == datetime(2026, 10, 12, 11, 0)
+    main.SENT.add("2026-10-12|E0|pre")
+    assert main.next_wakeup(by_weekday, datetime(2026, 10, 12, 11, 0, 5)) == datetime(2026, 10, 12, 12, 0)
+
+
+def test_next_wakeup_rechecks_instant_that_came_due_during_a_send():
+    main.SENT.clear()
+    main.SENT.update({"2026-10-12|E0|pre", "2026-10-12|E1|pre", "2026-10-12|E0|start"})
+    by_weekday = make_schedule("12:00", "12:01")
+    # E1 started at 12:01 while E0's send was still running and hasn't been sent
+    now = datetime(2026, 10, 12, 12, 1, 20)
+    assert main.next_wakeup(by_weekday, now) == now + main.RETRY_TD
+    main.SENT.add("2026-10-12|E1|start")
+    assert main.next_wakeup(by_weekday, now) == datetime(2026, 10, 13)
+
+
+def test_next_wakeup_ignores_unsent_instant_after_its_window():
+    main.SENT.clear()
+    by_weekday = make_schedule("12:00")
+    assert main.next_wakeup(by_weekday, datetime(2026, 10, 12, 12, 10)) == datetime(2026, 10, 13)
+
+
+def test_compile_events_skips_invalid_entries():
+    raw = [
+        {"name_en": "ok", "name_kr": "ok", "time": "12:00", "days": "Mon"},
+        {"name_en": "bad hour", "name_kr": "x", "time": "25:00", "days": ["Mon"]},
+        {"name_en": "bad minute", "name_kr": "x", "time": "12:60", "days": ["Mon"]},
+        {"name_en": "bad day", "name_kr": "x", "time": "12:00", "days": ["Monday"]},
+        {"name_en": "no time", "name_kr": "x", "days": ["Mon"]},
+        {"name_en": "bad thread", "name_kr": "x", "time": "12:00", "days": ["Mon"], "thread_id": [10]},
+        {"name_en": "bad name", "name_kr": ["x"], "time": "12:00", "days": ["Mon"]},
+    ]
+    events, by_weekday = main.compile_events(raw)
+    assert [ev.name_en for ev in events] == ["ok"]
+    assert events[0].days_set == frozenset({"Mon"})
+    assert list(by_weekday) == ["Mon"]
+
+
+def stub_send(monkeypatch, outcomes):
+    """Stub telegram_post to replay *outcomes* and asyncio.sleep to record delays.
+
+    Returns the (calls, sleeps) lists the stubs append to.
+    """
+    calls, sleeps = [], []
+    outcomes = list(outcomes)
+
+    async def fake_post(method, payload):
+        calls.append(method)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(main, "telegram_post", fake_post)
+    monkeypatch.setattr(main.asyncio, "sleep", fake_sleep)
+    return calls, sleeps
+
+
+def test_send_message_honours_flood_control(monkeypatch):
+    flood = main.TelegramAPIError(429, "Too Many Requests", retry_after=2)
+    calls, sleeps = stub_send(monkeypatch, [flood, {}])
+    asyncio.run(main.send_message("hi", 10))
+    assert (len(calls), sleeps) == (2, [2])
+
+
+def test_send_message_gives_up_on_long_flood_control(monkeypatch):
+    flood = main.TelegramAPIError(429, "Too Many Requests", retry_after=main.SEND_MAX_RETRY_AFTER + 1)
+    calls, sleeps = stub_send(monkeypatch, [flood, {}])
+    with pytest.raises(main.TelegramAPIError):
+        asyncio.run(main.send_message("hi", 10))
+    assert (len(calls), sleeps) == (1, [])
+
+
+def test_send_message_backs_off_on_server_errors(monkeypatch):
+    err = main.TelegramAPIError(502, "Bad Gateway")
+    calls, sleeps = stub_send(monkeypatch, [err, err, {}])
+    asyncio.run(main.send_message("hi", 10))
+    assert (len(calls), sleeps) == (3, [1, 2])
+
+
+def test_send_message_does_not_retry_client_errors(monkeypatch):
+    err = main.TelegramAPIError(400, "Bad Request: chat not found")
+    calls, sleeps = stub_send(monkeypatch, [err])
+    with pytest.raises(main.TelegramAPIError):
+        asyncio.run(main.send_message("hi", 10))
+    assert (len(calls), sleeps) == (1, [])
+
+
+def test_send_message_reraises_after_last_attempt(monkeypatch):
+    err = aiohttp.ClientConnectionError("connection reset")
+    calls, sleeps = stub_send(monkeypatch, [err] * main.SEND_ATTEMPTS)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(main.send_message("hi", 10))
+    assert (len(calls), sleeps) == (main.SEND_ATTEMPTS, [1, 2])
+
+
+def test_load_sent_keys_converts_legacy_layout(tmp_path):
+    path = tmp_path / "sent_records.json"
+    path.write_text('{"2026-10-10": {"AGB": ["pre", "start"], "ESI": ["pre"]}}', encoding="utf-8")
+    assert main.load_sent_keys(path) == {
+        "2026-10-10|AGB|pre",
+        "2026-10-10|AGB|start",
+        "2026-10-10|ESI|pre",
+    }
+
+
+def test_load_sent_keys_reads_key_list(tmp_path):
+    path = tmp_path / "sent_records.json"
+    path.write_text('["2026-10-10|AGB|pre"]', encoding="utf-8")
+    assert main.load_sent_keys(path) == {"2026-10-10|AGB|pre"}
+
+
+@pytest.mark.parametrize("content", ['{"2026-10-10": ["pre"]}', "[1, 2]", "[[1]]", "42"])
+def test_load_sent_keys_ignores_malformed_file(tmp_path, content):
+    path = tmp_path / "sent_records.json"
+    path.write_text(content, encoding="utf-8")
+    assert main.load_sent_keys(path) == set()